@@ -3,7 +3,11 @@ from flask_cors import CORS
 import os
 import uuid
 from werkzeug.utils import secure_filename
-from src.motion_detector import load_model, process_video
+from src.motion_detector import (
+    load_model, process_video, estimate_decoded_size, get_similarity_engine, SIMILARITY_ENGINES)
+from src.keypoint_cache import KeypointCache
+from src.inference_scheduler import InferenceScheduler, SchedulerBusy
+from src.storage import sweep
 from src.database import db, User
 import os
 
@@ -35,6 +39,16 @@ ALLOWED_EXTENSIONS = {'mp4', 'avi', 'mov', 'mkv'}
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['PROCESSED_FOLDER'] = PROCESSED_FOLDER
 
+# Processed videos get unique names and never change, so clients may cache them
+PROCESSED_MAX_AGE = int(os.getenv('PROCESSED_MAX_AGE_S', 7 * 24 * 3600))
+# Let a fronting proxy (nginx/Apache) stream files instead of the Flask workers
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true', 'yes')
+
+# Retention policy for uploads/ and processed/
+RETENTION_MAX_AGE = float(os.getenv('RETENTION_MAX_AGE_HOURS', 24)) * 3600
+RETENTION_MAX_BYTES = int(os.getenv('RETENTION_MAX_FOLDER_MB', 2048)) * 1024 * 1024
+RETENTION_GRACE = float(os.getenv('RETENTION_GRACE_S', 1800))
+
 def allowed_file(filename):
     """Check if the file has an allowed extension."""
     return '.' in filename and \
@@ -43,6 +57,21 @@ def allowed_file(filename):
 # Load the MoveNet model once when the server starts
 movenet_model, input_size = load_model(model_name="movenet_lightning")
 
+# All requests run inference through one scheduler that owns the model
+inference_scheduler = InferenceScheduler(
+    movenet_model, input_size,
+    max_batch_size=int(os.getenv('INFERENCE_MAX_BATCH_SIZE', 8)),
+    max_batch_latency=float(os.getenv('INFERENCE_MAX_BATCH_LATENCY_MS', 5)) / 1000,
+    max_concurrent_jobs=int(os.getenv('MAX_CONCURRENT_JOBS', 2)),
+    memory_budget_bytes=int(os.getenv('PROCESSING_MEMORY_BUDGET_MB', 2048)) * 1024 * 1024)
+JOB_ADMISSION_TIMEOUT = float(os.getenv('JOB_ADMISSION_TIMEOUT_S', 120))
+
+# Similarity engine used unless the upload asks for another one
+SIMILARITY_ENGINE = os.getenv('SIMILARITY_ENGINE', 'coordinate')
+get_similarity_engine(SIMILARITY_ENGINE)  # Fail at startup on a misconfigured engine
+# Reference keypoints and features are computed once and reused across requests
+keypoint_cache = KeypointCache(os.getenv('KEYPOINT_CACHE_FOLDER', 'cache'))
+
 @app.route('/')
 def index():
     return '''
@@ -63,31 +92,54 @@ def upload_video():
     if file.filename == '':
         return jsonify({'error': 'No selected file'}), 400
 
+    similarity_engine = request.form.get('engine', SIMILARITY_ENGINE)
+    if similarity_engine not in SIMILARITY_ENGINES:
+        return jsonify({'error': f"Unknown similarity engine: {similarity_engine}"}), 400
+
     if file and allowed_file(file.filename):
         filename = secure_filename(file.filename)
         unique_id = uuid.uuid4().hex
         input_path = os.path.join(app.config['UPLOAD_FOLDER'], f"{unique_id}_{filename}")
         output_filename = f"processed_{unique_id}_{os.path.splitext(filename)[0]}.mp4"
         output_path = os.path.join(app.config['PROCESSED_FOLDER'], output_filename)
-        file.save(input_path)
 
         # Check if reference video exists
         if not os.path.exists(REFERENCE_VIDEO_PATH):
             return jsonify({'error': f"Reference video not found at {REFERENCE_VIDEO_PATH}"}), 500
 
+        file.save(input_path)
+
         # Process the video to detect and overlay keypoints, and compute similarity
         try:
-            similarity_score = process_video(
-                input_path, REFERENCE_VIDEO_PATH, output_path, movenet_model, input_size)
+            job_bytes = estimate_decoded_size(input_path)
+            # The reference is only decoded when its keypoints are not cached yet
+            if not keypoint_cache.contains(REFERENCE_VIDEO_PATH, input_size):
+                job_bytes += estimate_decoded_size(REFERENCE_VIDEO_PATH)
+            with inference_scheduler.job(nbytes=job_bytes, timeout=JOB_ADMISSION_TIMEOUT):
+                similarity_score = process_video(
+                    input_path, REFERENCE_VIDEO_PATH, output_path, movenet_model, input_size,
+                    scheduler=inference_scheduler, similarity_engine=similarity_engine,
+                    cache=keypoint_cache)
+        except SchedulerBusy as e:
+            return jsonify({"error": str(e)}), 503
         except Exception as e:
             return jsonify({"error": f"Video processing failed: {str(e)}"}), 500
+        finally:
+            # The upload is only needed while processing; the sweep bounds processed/
+            try:
+                os.remove(input_path)
+            except OSError as e:
+                app.logger.warning("Could not remove upload %s: %s", input_path, e)
+            sweep([UPLOAD_FOLDER, PROCESSED_FOLDER], max_age_seconds=RETENTION_MAX_AGE,
+                  max_total_bytes=RETENTION_MAX_BYTES, min_age_seconds=RETENTION_GRACE)
 
         # Generate the absolute URL to access the processed video
         processed_video_url = url_for('get_processed_video', filename=output_filename, _external=True)
 
         response = {
             'processed_video_url': processed_video_url,
-            'similarity_score': similarity_score
+            'similarity_score': similarity_score,
+            'similarity_engine': similarity_engine
         }
 
         return jsonify(response), 200
@@ -96,7 +148,9 @@ def upload_video():
 
 @app.route('/processed/<filename>', methods=['GET'])
 def get_processed_video(filename):
-    return send_from_directory(PROCESSED_FOLDER, filename)
+    # Conditional responses give ETag/Last-Modified validation and byte-range support
+    return send_from_directory(PROCESSED_FOLDER, filename, mimetype='video/mp4',
+                               conditional=True, etag=True, max_age=PROCESSED_MAX_AGE)
 
 @app.route('/update_score', methods=['POST'])
 def update_score():
@@ -128,4 +182,4 @@ def get_score():
     return jsonify({'score': user.score}), 200
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8000, debug=True)
+    app.run(host='0.0.0.0', port=8000, debug=True, threaded=True)
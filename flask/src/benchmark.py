@@ -0,0 +1,502 @@
+# benchmark.py
+#
+# Run from the flask/ directory:
+#   python -m src.benchmark --output bench.json
+#   python -m src.benchmark --baseline benchmark_baseline.json --update_baseline
+#   python -m src.benchmark --baseline benchmark_baseline.json
+#   python -m src.benchmark --engine joint_angle --compare_engines --output bench.json
+
+import os
+
+# Benchmarks always run on CPU so numbers are comparable across machines. This
+# overrides any existing setting and is inherited by the per-clip processes.
+os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+import cv2
+import imageio
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from dtaidistance import dtw_ndim
+
+from src.motion_detector import (
+    MODEL_URLS, SIMILARITY_ENGINES, ANGLE_JOINTS, KEYPOINT_DICT, load_model, extract_frames,
+    extract_keypoints_and_crop, init_crop_region, determine_crop_region, crop_and_resize,
+    get_similarity_engine, write_processed_video, process_video)
+
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+REFERENCE_VIDEO_PATH = os.path.join(ASSETS_DIR, 'pushup.mp4')
+ASSET_VIDEOS = {
+    'pushup': os.path.join(ASSETS_DIR, 'pushup.mp4'),
+    'video': os.path.join(ASSETS_DIR, 'video.mp4'),
+}
+
+# Default regression thresholds (relative for throughput/memory, absolute for score)
+MAX_THROUGHPUT_DROP = 0.20
+MAX_MEMORY_GROWTH = 0.20
+SCORE_TOLERANCE = 0.01
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MiB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+def ensure_cached_model(model_name, cache_dir, allow_download=False):
+    """
+    Points TensorFlow Hub at a local cache and checks the model is already there.
+
+    Args:
+        model_name (str): The MoveNet variant to load.
+        cache_dir (str): TensorFlow Hub cache directory.
+        allow_download (bool): Whether a missing model may be fetched from the network.
+    """
+    os.environ['TFHUB_CACHE_DIR'] = cache_dir
+    # TensorFlow Hub stores each module under the SHA-1 of its handle
+    module_dir = os.path.join(cache_dir, hashlib.sha1(MODEL_URLS[model_name].encode('utf8')).hexdigest())
+    if not os.path.isdir(module_dir) and not allow_download:
+        raise SystemExit(
+            f"Model {model_name} is not cached in {cache_dir}. "
+            "Re-run once with --allow_download to populate the cache.")
+
+def make_synthetic_clips(source_path, work_dir, loops=4, scale=2):
+    """
+    Builds longer and higher-resolution clips from a bundled asset.
+
+    Args:
+        source_path (str): Path to the source video.
+        work_dir (str): Directory to write the synthetic clips to.
+        loops (int): How many times the source is repeated for the long clip.
+        scale (int): Upscaling factor for the high-resolution clip.
+
+    Returns:
+        dict: Clip name mapped to video path.
+    """
+    frames = extract_frames(source_path)
+    height, width = frames[0].shape[:2]
+    clips = {
+        f'synthetic_long_x{loops}': (frames * loops, lambda frame: frame),
+        f'synthetic_hires_x{scale}': (frames, lambda frame: cv2.resize(
+            frame, (width * scale, height * scale), interpolation=cv2.INTER_LINEAR)),
+    }
+
+    paths = {}
+    for name, (clip_frames, transform) in clips.items():
+        path = os.path.join(work_dir, f'{name}.mp4')
+        writer = imageio.get_writer(path, fps=30, macro_block_size=1)
+        for frame in clip_frames:
+            writer.append_data(transform(frame[:, :, :3]))
+        writer.close()
+        paths[name] = path
+    return paths
+
+class TimedModel:
+    """Wraps a model signature and accumulates the time spent inside its calls."""
+
+    def __init__(self, model):
+        self.model = model
+        self.seconds = 0.0
+
+    def __call__(self, input_image):
+        start = time.perf_counter()
+        outputs = self.model(input_image)
+        self.seconds += time.perf_counter() - start
+        return outputs
+
+def stage_metrics(num_frames, wall):
+    """Returns the recorded metrics for a stage that processed `num_frames` in `wall` seconds."""
+    return {
+        'wall_s': round(wall, 4),
+        'fps': round(num_frames / wall, 2) if wall > 0 else None,
+    }
+
+def timed(stage_results, name, num_frames, fn, *args, **kwargs):
+    """
+    Runs a stage, recording wall time and frames/sec under `name`.
+
+    `num_frames` may be a function of the stage's result, for stages such as
+    decoding whose frame count is only known afterwards.
+    """
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    wall = time.perf_counter() - start
+    if callable(num_frames):
+        num_frames = num_frames(result)
+    stage_results[name] = stage_metrics(num_frames, wall)
+    return result
+
+def replay_crops(frames, detected_keypoints, input_size):
+    """Recomputes every crop region and crop for a clip, isolating the crop cost."""
+    image_height, image_width = frames[0].shape[:2]
+    crop_region = init_crop_region(image_height, image_width)
+    for frame, keypoints in zip(frames, detected_keypoints):
+        crop_and_resize(np.expand_dims(frame[:, :, :3], axis=0), crop_region,
+                        crop_size=[input_size, input_size])
+        crop_region = determine_crop_region(keypoints, image_height, image_width)
+
+def benchmark_clip(clip_path, ref_features, movenet_model, input_size, work_dir, engine):
+    """
+    Benchmarks each pipeline stage and the end-to-end run for one clip.
+
+    `keypoint_detection` is the whole per-frame detection loop; `inference`
+    is only the time spent inside model calls during that loop, and `crop`
+    replays the crop computations on their own.
+
+    Args:
+        clip_path (str): Path to the clip used as the input video.
+        ref_features (dict): The engine's features for the reference video.
+        movenet_model: The loaded MoveNet model signature.
+        input_size (int): The input size for the model.
+        work_dir (str): Directory for rendered outputs.
+        engine: The similarity engine used for normalize, DTW and similarity.
+
+    Returns:
+        dict: Frame count, per-stage metrics and the end-to-end similarity score.
+    """
+    stages = {}
+    frames = timed(stages, 'decode', len, extract_frames, clip_path)
+    num_frames = len(frames)
+
+    timed_model = TimedModel(movenet_model)
+    detected = timed(stages, 'keypoint_detection', num_frames,
+                     extract_keypoints_and_crop, timed_model, frames, input_size)
+    stages['inference'] = stage_metrics(num_frames, timed_model.seconds)
+    timed(stages, 'crop', num_frames, replay_crops, frames, detected, input_size)
+
+    target_kpts = np.array(detected).squeeze()
+    target_features = timed(stages, 'normalize', num_frames,
+                            engine.extract_features, target_kpts, frames[0].shape[:2])
+
+    warped_path = timed(stages, 'dtw', num_frames, lambda: dtw_ndim.warping_path(
+        engine.dtw_series(ref_features), engine.dtw_series(target_features)))
+
+    _, per_frame = timed(stages, 'similarity', len(warped_path),
+                         engine.score, ref_features, target_features, warped_path)
+
+    render_path = os.path.join(work_dir, 'render_' + os.path.basename(clip_path))
+    timed(stages, 'render', len(warped_path), write_processed_video,
+          frames, detected, warped_path, per_frame, render_path)
+    del frames, detected
+
+    output_path = os.path.join(work_dir, 'processed_' + os.path.basename(clip_path))
+    score = timed(stages, 'end_to_end', num_frames, process_video,
+                  clip_path, REFERENCE_VIDEO_PATH, output_path, movenet_model, input_size,
+                  similarity_engine=engine.name)
+
+    return {'frames': num_frames, 'score': round(score, 6), 'stages': stages}
+
+# Fewer independent pairs than this make correlations meaningless
+MIN_AGREEMENT_PAIRS = 3
+# Every other engine's scores and marks are compared against this one
+BASELINE_ENGINE = 'coordinate'
+
+def _average_ranks(values):
+    """Returns the rank of each value, giving tied values the average of their ranks."""
+    values = np.asarray(values)
+    order = np.argsort(values, kind='stable')
+    ranks = np.empty(len(values))
+    ranks[order] = np.arange(len(values), dtype=float)
+    for value in np.unique(values):
+        tied = values == value
+        ranks[tied] = ranks[tied].mean()
+    return ranks
+
+def compare_engines(clip_keypoints):
+    """
+    Scores every unordered pair of distinct clips with each similarity engine and reports
+    how each engine agrees with the `BASELINE_ENGINE`.
+
+    Clips should come from distinct source recordings; looped or rescaled
+    copies of one recording would not add independent pairs.
+
+    Args:
+        clip_keypoints (dict): Clip name mapped to (keypoints, image_shape).
+
+    Returns:
+        dict: Per-engine timings and dimensions, per-pair scores, and agreement statistics
+            keyed by engine name.
+    """
+    engines = sorted(SIMILARITY_ENGINES)
+    compared = [name for name in engines if name != BASELINE_ENGINE]
+    features = {name: {} for name in engines}
+    report = {'baseline_engine': BASELINE_ENGINE, 'engines': {}, 'pairs': []}
+
+    for name in engines:
+        engine = get_similarity_engine(name)
+        start = time.perf_counter()
+        for clip, (keypoints, image_shape) in clip_keypoints.items():
+            features[name][clip] = engine.extract_features(keypoints, image_shape)
+        report['engines'][name] = {
+            'feature_dim': int(engine.dtw_series(next(iter(features[name].values()))).shape[1]),
+            'features_s': round(time.perf_counter() - start, 4),
+            'dtw_s': 0.0,
+            'score_s': 0.0,
+        }
+
+    # Only the joints every engine can flag are compared for marking agreement
+    angle_joints = [KEYPOINT_DICT[joint] for joint in ANGLE_JOINTS]
+    for ref_clip, target_clip in itertools.combinations(clip_keypoints, 2):
+        pair = {'reference': ref_clip, 'target': target_clip}
+        marks = {}
+        for name in engines:
+            engine = get_similarity_engine(name)
+            ref_features, target_features = features[name][ref_clip], features[name][target_clip]
+            start = time.perf_counter()
+            path = dtw_ndim.warping_path(engine.dtw_series(ref_features), engine.dtw_series(target_features))
+            report['engines'][name]['dtw_s'] += time.perf_counter() - start
+            start = time.perf_counter()
+            score, per_frame = engine.score(ref_features, target_features, path)
+            report['engines'][name]['score_s'] += time.perf_counter() - start
+            pair[name] = round(score, 6)
+            # Marks per target frame, so engines with different DTW paths are comparable
+            frame_marks = np.zeros((len(clip_keypoints[target_clip][0]), len(angle_joints)), dtype=bool)
+            for step, (_, target_idx) in enumerate(path):
+                frame_marks[target_idx] |= per_frame[step, angle_joints] < 0.9
+            marks[name] = frame_marks
+        pair['mark_agreement'] = {
+            name: round(float(np.mean(marks[name] == marks[BASELINE_ENGINE])), 4) for name in compared}
+        report['pairs'].append(pair)
+
+    for timings in report['engines'].values():
+        timings['dtw_s'] = round(timings['dtw_s'], 4)
+        timings['score_s'] = round(timings['score_s'], 4)
+
+    report['agreement'] = {}
+    baseline_scores = np.array([pair[BASELINE_ENGINE] for pair in report['pairs']])
+    for name in compared:
+        scores = np.array([pair[name] for pair in report['pairs']])
+        agreement = {'independent_pairs': len(scores)}
+        if len(scores):
+            agreement['mean_abs_diff'] = round(float(np.mean(np.abs(scores - baseline_scores))), 6)
+            agreement['mean_mark_agreement'] = round(
+                float(np.mean([pair['mark_agreement'][name] for pair in report['pairs']])), 4)
+        if len(scores) < MIN_AGREEMENT_PAIRS:
+            agreement['note'] = (f"correlations need at least {MIN_AGREEMENT_PAIRS} independent pairs; "
+                                 "pass more recordings with --agreement_videos")
+        elif np.std(scores) > 0 and np.std(baseline_scores) > 0:
+            agreement['pearson'] = round(float(np.corrcoef(scores, baseline_scores)[0, 1]), 4)
+            ranks = [_average_ranks(scores), _average_ranks(baseline_scores)]
+            if np.std(ranks[0]) > 0 and np.std(ranks[1]) > 0:
+                agreement['spearman'] = round(float(np.corrcoef(ranks[0], ranks[1])[0, 1]), 4)
+        report['agreement'][name] = agreement
+    return report
+
+def run_clip(model_name, similarity_engine, clip_path, work_dir, repeat=1):
+    """
+    Benchmarks one clip from a fresh process, so its peak RSS is its own.
+
+    ru_maxrss only ever grows within a process, so per-stage or per-clip memory
+    measured in a shared process would carry over earlier allocations.
+
+    Args:
+        model_name (str): The MoveNet variant to benchmark.
+        similarity_engine (str): Name of the similarity engine to benchmark.
+        clip_path (str): Path to the clip used as the input video.
+        work_dir (str): Directory for rendered outputs.
+        repeat (int): Runs of the clip; the fastest run of each stage is kept.
+
+    Returns:
+        dict: Output of `benchmark_clip` plus the process's peak RSS.
+    """
+    movenet_model, input_size = load_model(model_name=model_name)
+    engine = get_similarity_engine(similarity_engine)
+
+    ref_frames = extract_frames(REFERENCE_VIDEO_PATH)
+    ref_kpts = np.array(extract_keypoints_and_crop(movenet_model, ref_frames, input_size)).squeeze()
+    ref_features = engine.extract_features(ref_kpts, ref_frames[0].shape[:2])
+    del ref_frames
+
+    best = None
+    for _ in range(repeat):
+        run = benchmark_clip(clip_path, ref_features, movenet_model, input_size, work_dir, engine)
+        if best is None:
+            best = run
+            continue
+        for stage, metrics in run['stages'].items():
+            if metrics['wall_s'] < best['stages'][stage]['wall_s']:
+                best['stages'][stage] = metrics
+
+    best['peak_rss_mb'] = round(peak_rss_mb(), 1)
+    return best
+
+def run_benchmarks(model_name, include_synthetic=True, repeat=1, similarity_engine='coordinate',
+                   with_engine_comparison=False, agreement_videos=()):
+    """
+    Runs the benchmark over the bundled assets and the synthetic clips.
+
+    Each clip runs in its own child process (see `run_clip`).
+
+    Args:
+        model_name (str): The MoveNet variant to benchmark.
+        include_synthetic (bool): Whether to add the longer/higher-resolution clips.
+        repeat (int): Runs per clip; the fastest run of each stage is kept.
+        similarity_engine (str): Name of the similarity engine to benchmark.
+        with_engine_comparison (bool): Whether to add the engine agreement report.
+        agreement_videos (list): Extra recordings for the agreement report, alongside the
+            bundled assets. Synthetic clips are never used there.
+
+    Returns:
+        dict: Environment metadata and results keyed by clip name.
+    """
+    results = {
+        'meta': {
+            'model': model_name,
+            'device': 'cpu',
+            'similarity_engine': similarity_engine,
+            'python': platform.python_version(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+        },
+        'clips': {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix='cortexmd_bench_') as work_dir:
+        clips = dict(ASSET_VIDEOS)
+        if include_synthetic:
+            clips.update(make_synthetic_clips(REFERENCE_VIDEO_PATH, work_dir))
+
+        for name, path in clips.items():
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+                best = executor.submit(run_clip, model_name, similarity_engine, path, work_dir, repeat).result()
+            results['clips'][name] = best
+            print(f"{name}: {best['frames']} frames, score {best['score']:.4f}, "
+                  f"end-to-end {best['stages']['end_to_end']['fps']} fps, peak RSS {best['peak_rss_mb']} MiB")
+
+        if with_engine_comparison:
+            movenet_model, input_size = load_model(model_name=model_name)
+            agreement_clips = dict(ASSET_VIDEOS)
+            agreement_clips.update({os.path.basename(path): path for path in agreement_videos})
+            clip_keypoints = {}
+            for name, path in agreement_clips.items():
+                frames = extract_frames(path)
+                keypoints = np.array(extract_keypoints_and_crop(movenet_model, frames, input_size)).squeeze()
+                clip_keypoints[name] = (keypoints, frames[0].shape[:2])
+                del frames
+            results['engine_agreement'] = compare_engines(clip_keypoints)
+            print(f"Engine agreement: {results['engine_agreement'].get('agreement')}")
+
+    return results
+
+def compare_to_baseline(results, baseline, max_throughput_drop=MAX_THROUGHPUT_DROP,
+                        max_memory_growth=MAX_MEMORY_GROWTH, score_tolerance=SCORE_TOLERANCE):
+    """
+    Compares benchmark results against a stored baseline.
+
+    Args:
+        results (dict): Output of `run_benchmarks`.
+        baseline (dict): Previously recorded output of `run_benchmarks`.
+        max_throughput_drop (float): Allowed relative drop in frames/sec per stage.
+        max_memory_growth (float): Allowed relative growth in peak RSS per clip.
+        score_tolerance (float): Allowed absolute change in similarity score.
+
+    Returns:
+        list: Human-readable descriptions of every regression found.
+    """
+    regressions = []
+    baseline_engine = baseline.get('meta', {}).get('similarity_engine', 'coordinate')
+    if results['meta']['similarity_engine'] != baseline_engine:
+        regressions.append(
+            f"similarity engine {results['meta']['similarity_engine']} differs from baseline {baseline_engine}")
+    baseline_device = baseline.get('meta', {}).get('device', 'cpu')
+    if results['meta'].get('device', 'cpu') != baseline_device:
+        regressions.append(f"device {results['meta']['device']} differs from baseline {baseline_device}")
+    for clip, expected in baseline.get('clips', {}).items():
+        actual = results['clips'].get(clip)
+        if actual is None:
+            regressions.append(f"{clip}: missing from results")
+            continue
+
+        if abs(actual['score'] - expected['score']) > score_tolerance:
+            regressions.append(
+                f"{clip}: score {actual['score']:.4f} differs from baseline {expected['score']:.4f}")
+
+        if 'peak_rss_mb' in expected and \
+                actual['peak_rss_mb'] > expected['peak_rss_mb'] * (1 + max_memory_growth):
+            regressions.append(
+                f"{clip}: peak RSS {actual['peak_rss_mb']} MiB vs baseline {expected['peak_rss_mb']} MiB")
+
+        for stage, base_metrics in expected['stages'].items():
+            metrics = actual['stages'].get(stage)
+            if metrics is None:
+                regressions.append(f"{clip}/{stage}: missing from results")
+                continue
+            if base_metrics['fps'] and metrics['fps'] is not None and \
+                    metrics['fps'] < base_metrics['fps'] * (1 - max_throughput_drop):
+                regressions.append(
+                    f"{clip}/{stage}: {metrics['fps']} fps vs baseline {base_metrics['fps']} fps")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CortexMD video processing pipeline")
+    parser.add_argument('--model', type=str, default='movenet_lightning', choices=sorted(MODEL_URLS),
+                        help='MoveNet variant to benchmark')
+    parser.add_argument('--model_cache', type=str,
+                        default=os.getenv('TFHUB_CACHE_DIR', os.path.expanduser('~/.cache/tfhub_modules')),
+                        help='Local TensorFlow Hub cache directory')
+    parser.add_argument('--engine', type=str, default='coordinate', choices=sorted(SIMILARITY_ENGINES),
+                        help='Similarity engine to benchmark')
+    parser.add_argument('--compare_engines', action='store_true',
+                        help='Add a score agreement report between the similarity engines')
+    parser.add_argument('--agreement_videos', type=str, nargs='*', default=[],
+                        help='Extra recordings of distinct performances for the agreement report')
+    parser.add_argument('--allow_download', action='store_true',
+                        help='Download the model if it is not cached yet')
+    parser.add_argument('--no_synthetic', action='store_true',
+                        help='Only benchmark the bundled assets')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per clip (fastest is kept)')
+    parser.add_argument('--output', type=str, default=None, help='Write results JSON to this path')
+    parser.add_argument('--baseline', type=str, default=None, help='Baseline JSON to compare against')
+    parser.add_argument('--update_baseline', action='store_true',
+                        help='Overwrite the baseline with these results instead of comparing')
+    parser.add_argument('--max_throughput_drop', type=float, default=MAX_THROUGHPUT_DROP)
+    parser.add_argument('--max_memory_growth', type=float, default=MAX_MEMORY_GROWTH)
+    parser.add_argument('--score_tolerance', type=float, default=SCORE_TOLERANCE)
+
+    args = parser.parse_args()
+
+    ensure_cached_model(args.model, args.model_cache, allow_download=args.allow_download)
+    results = run_benchmarks(args.model, include_synthetic=not args.no_synthetic, repeat=args.repeat,
+                             similarity_engine=args.engine, with_engine_comparison=args.compare_engines,
+                             agreement_videos=args.agreement_videos)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if not args.baseline:
+        return
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare_to_baseline(
+        results, baseline, max_throughput_drop=args.max_throughput_drop,
+        max_memory_growth=args.max_memory_growth, score_tolerance=args.score_tolerance)
+    if regressions:
+        print("Regressions against baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print("No regressions against baseline.")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# inference_scheduler.py
+
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+import tensorflow as tf
+
+from src.motion_detector import crop_and_resize, movenet_inference, map_keypoints_to_image
+
+class SchedulerBusy(Exception):
+    """Raised when a job cannot be admitted within the concurrency/memory budget."""
+
+class _InferenceRequest:
+    """A single model input waiting for inference, completed by the scheduler thread."""
+
+    def __init__(self, input_image):
+        self.input_image = input_image
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class InferenceScheduler:
+    """
+    Owns the MoveNet model and serves inference to concurrent requests.
+
+    Callers crop and resize their frames on their own threads and queue only
+    the model input. A single worker thread runs the model, so the model is
+    never called concurrently. When the model accepts batches, the worker
+    coalesces inputs from concurrent jobs into micro-batches. A batch closes
+    once it has one input per job currently detecting keypoints (see
+    `detecting()`; each such job has at most one frame in flight), reaches
+    `max_batch_size`, or has waited `max_batch_latency` seconds. Single-pose MoveNet signatures only take a batch of one, so with
+    them every input runs as soon as it arrives.
+
+    Whole processing jobs are admitted through `job()`, which enforces a global
+    limit on concurrent jobs and on the estimated bytes of decoded frames held
+    in memory at once.
+    """
+
+    def __init__(self, movenet_model, input_size, max_batch_size=8, max_batch_latency=0.005,
+                 max_concurrent_jobs=2, memory_budget_bytes=None):
+        """
+        Args:
+            movenet_model: The loaded MoveNet model signature.
+            input_size (int): The input size for the model.
+            max_batch_size (int): Maximum number of frames run in one model call.
+            max_batch_latency (float): Seconds to wait for more frames before running a batch.
+            max_concurrent_jobs (int): Maximum number of videos processed at once.
+            memory_budget_bytes (int, optional): Maximum decoded frame bytes across running jobs.
+        """
+        self.movenet_model = movenet_model
+        self.input_size = input_size
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_batch_latency = max_batch_latency
+        self.memory_budget_bytes = memory_budget_bytes
+
+        self._queue = queue.Queue()
+        self._job_slots = threading.BoundedSemaphore(max_concurrent_jobs)
+        self._memory_condition = threading.Condition()
+        self._memory_in_use = 0
+        self._detecting_jobs = 0
+        self._detecting_lock = threading.Lock()
+        self._supports_batching = None
+
+        self._worker = threading.Thread(target=self._run, name="inference-scheduler", daemon=True)
+        self._worker.start()
+
+    def run_inference(self, image, crop_region):
+        """
+        Runs inference for one frame and blocks until its keypoints are ready.
+
+        The crop runs on the calling thread; only the model call is scheduled.
+
+        Args:
+            image (np.ndarray): The RGB frame.
+            crop_region (dict): The region of the frame to run the model on.
+
+        Returns:
+            np.ndarray: Keypoints with scores in image coordinates.
+        """
+        input_image = crop_and_resize(
+            tf.expand_dims(image, axis=0), crop_region, crop_size=[self.input_size, self.input_size])
+        request = _InferenceRequest(input_image)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return map_keypoints_to_image(request.result, crop_region)
+
+    @contextmanager
+    def detecting(self):
+        """
+        Marks the calling job as submitting frames for the duration of the block.
+
+        Jobs that are decoding, aligning or rendering have no frame to add to a
+        batch, so only jobs inside this block are waited for.
+        """
+        with self._detecting_lock:
+            self._detecting_jobs += 1
+        try:
+            yield
+        finally:
+            with self._detecting_lock:
+                self._detecting_jobs -= 1
+
+    @contextmanager
+    def job(self, nbytes=0, timeout=None):
+        """
+        Admits a processing job within the concurrency and memory budget.
+
+        Args:
+            nbytes (int): Estimated bytes of decoded frames the job will hold.
+            timeout (float, optional): Seconds to wait for admission.
+
+        Raises:
+            SchedulerBusy: If the job could not be admitted before the timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        if not self._job_slots.acquire(timeout=timeout):
+            raise SchedulerBusy("Too many videos are being processed, try again later")
+
+        try:
+            # A job larger than the whole budget is still admitted once it has it all to itself
+            if self.memory_budget_bytes is not None:
+                nbytes = min(nbytes, self.memory_budget_bytes)
+            with self._memory_condition:
+                admitted = self._memory_condition.wait_for(
+                    lambda: self.memory_budget_bytes is None or
+                    self._memory_in_use + nbytes <= self.memory_budget_bytes,
+                    timeout=None if deadline is None else max(0.0, deadline - time.monotonic()))
+                if not admitted:
+                    raise SchedulerBusy("Not enough memory to process the video, try again later")
+                self._memory_in_use += nbytes
+
+            try:
+                yield
+            finally:
+                with self._memory_condition:
+                    self._memory_in_use -= nbytes
+                    self._memory_condition.notify_all()
+        finally:
+            self._job_slots.release()
+
+    def close(self):
+        """Stops the worker thread once the queued frames have been served."""
+        self._queue.put(None)
+        self._worker.join()
+
+    def _run(self):
+        """Worker loop: collects micro-batches and runs them."""
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+            batch = [request]
+            if self._batching_supported():
+                stop = self._collect(batch)
+            else:
+                stop = False
+            self._run_batch(batch)
+            if stop:
+                return
+
+    def _collect(self, batch):
+        """
+        Adds queued inputs to `batch` until it has one per detecting job.
+
+        Returns:
+            bool: Whether the stop sentinel was seen.
+        """
+        deadline = time.monotonic() + self.max_batch_latency
+        # Each detecting job has at most one frame in flight, so a larger batch can never fill
+        target = min(self.max_batch_size, max(1, self._detecting_jobs))
+        while len(batch) < target:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                return False
+            if request is None:
+                return True
+            batch.append(request)
+        return False
+
+    def _run_batch(self, batch):
+        """Runs one micro-batch and hands each request its raw model output."""
+        try:
+            if len(batch) > 1:
+                outputs = movenet_inference(
+                    self.movenet_model, tf.concat([request.input_image for request in batch], axis=0))
+                outputs = np.split(outputs, len(batch), axis=0)
+            else:
+                outputs = [movenet_inference(self.movenet_model, batch[0].input_image)]
+            for request, keypoints_with_scores in zip(batch, outputs):
+                request.result = keypoints_with_scores
+        except Exception as e:
+            for request in batch:
+                request.error = e
+        finally:
+            for request in batch:
+                request.done.set()
+
+    def _batching_supported(self):
+        """Checks once whether the model signature accepts a batch dimension above one."""
+        if self._supports_batching is None:
+            probe = tf.zeros([2, self.input_size, self.input_size, 3], dtype=tf.int32)
+            try:
+                self._supports_batching = movenet_inference(self.movenet_model, probe).shape[0] == 2
+            except Exception:
+                # Single-pose MoveNet signatures are fixed to a batch of one
+                self._supports_batching = False
+        return self._supports_batching
@@ -0,0 +1,64 @@
+# keypoint_cache.py
+
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+class KeypointCache:
+    """
+    Stores detected keypoints, and features derived from them, per video on disk.
+
+    Entries are `.npz` files keyed by the video's path, size and modification
+    time plus the model input size, so replacing a video or switching models
+    never returns stale keypoints.
+    """
+
+    def __init__(self, cache_dir):
+        """
+        Args:
+            cache_dir (str): Directory holding the cache files.
+        """
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, video_path, input_size):
+        """Returns the cache file for a video."""
+        stat = os.stat(video_path)
+        key = f"{os.path.abspath(video_path)}:{stat.st_size}:{stat.st_mtime_ns}:{input_size}"
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode('utf8')).hexdigest() + '.npz')
+
+    def contains(self, video_path, input_size):
+        """Returns whether keypoints for a video are cached."""
+        return os.path.exists(self._path(video_path, input_size))
+
+    def load(self, video_path, input_size):
+        """
+        Loads the cached arrays for a video.
+
+        Returns:
+            dict: Array name mapped to array, or None if nothing is cached.
+        """
+        path = self._path(video_path, input_size)
+        try:
+            with np.load(path) as data:
+                return {name: data[name] for name in data.files}
+        except (FileNotFoundError, OSError, ValueError):
+            return None
+
+    def save(self, video_path, input_size, arrays):
+        """
+        Stores the arrays for a video, replacing any previous entry atomically.
+
+        Args:
+            video_path (str): Path to the video the arrays were computed from.
+            input_size (int): The input size of the model that produced the keypoints.
+            arrays (dict): Array name mapped to array.
+        """
+        path = self._path(video_path, input_size)
+        tmp_path = f"{path[:-len('.npz')]}.{threading.get_ident()}.tmp.npz"
+        with self._lock:
+            np.savez(tmp_path, **arrays)
+            os.replace(tmp_path, path)
@@ -0,0 +1,98 @@
+# load_test.py
+#
+# Start the server (python app.py), then from the flask/ directory:
+#   python -m src.load_test --video src/assets/video.mp4 --concurrency 4 --requests 8
+
+import argparse
+import os
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+def timed_upload(file_path, server_url):
+    """
+    Uploads a video once and measures how long the server takes to respond.
+
+    Args:
+        file_path (str): Path to the video file to upload.
+        server_url (str): URL of the Flask server's upload endpoint.
+
+    Returns:
+        dict: Status code (None on connection errors), latency in seconds and similarity score.
+    """
+    filename = os.path.basename(file_path)
+    start = time.perf_counter()
+    try:
+        with open(file_path, 'rb') as f:
+            response = requests.post(server_url, files={'video': (filename, f, 'video/mp4')})
+        status = response.status_code
+        score = response.json().get('similarity_score') if status == 200 else None
+    except requests.exceptions.RequestException as e:
+        print(f"Error uploading video: {e}")
+        status, score = None, None
+    return {'status': status, 'latency': time.perf_counter() - start, 'score': score}
+
+def run_load_test(file_path, server_url, concurrency, num_requests):
+    """
+    Drives `num_requests` uploads against the server, `concurrency` at a time.
+
+    Args:
+        file_path (str): Path to the video file to upload.
+        server_url (str): URL of the Flask server's upload endpoint.
+        concurrency (int): Number of uploads in flight at once.
+        num_requests (int): Total number of uploads.
+
+    Returns:
+        dict: Summary with throughput, latency percentiles and status counts.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda _: timed_upload(file_path, server_url), range(num_requests)))
+    elapsed = time.perf_counter() - start
+
+    latencies = sorted(result['latency'] for result in results if result['status'] == 200)
+    status_counts = {}
+    for result in results:
+        status_counts[str(result['status'])] = status_counts.get(str(result['status']), 0) + 1
+
+    summary = {
+        'concurrency': concurrency,
+        'requests': num_requests,
+        'elapsed_s': round(elapsed, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 3),
+        'status_counts': status_counts,
+    }
+    if latencies:
+        summary['latency_p50_s'] = round(statistics.median(latencies), 2)
+        summary['latency_p95_s'] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2)
+        summary['latency_max_s'] = round(latencies[-1], 2)
+        scores = {round(result['score'], 4) for result in results if result['score'] is not None}
+        summary['distinct_scores'] = sorted(scores)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the Flask Motion Tracker upload endpoint")
+    parser.add_argument('--video', type=str, required=True, help='Path to the video file to upload')
+    parser.add_argument('--server', type=str, default='http://localhost:8000/upload', help='Flask server upload URL')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4],
+                        help='Concurrency levels to run, one after another')
+    parser.add_argument('--requests', type=int, default=None,
+                        help='Uploads per level (defaults to twice the concurrency)')
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.video):
+        print(f"File not found: {args.video}")
+        return
+
+    for concurrency in args.concurrency:
+        num_requests = args.requests or concurrency * 2
+        print(f"Running {num_requests} uploads at concurrency {concurrency}...")
+        summary = run_load_test(args.video, args.server, concurrency, num_requests)
+        for key, value in summary.items():
+            print(f"  {key}: {value}")
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,21 @@ from numpy.linalg import norm
 from dtaidistance import dtw_ndim
 import cv2
 import imageio
+import logging
+import os
+import warnings
+from contextlib import nullcontext
+
+logger = logging.getLogger(__name__)
+
+# Seconds ffmpeg may take to finish an encode once all frames are written
+FFMPEG_TIMEOUT = 120
+
+# TensorFlow Hub handles for the supported MoveNet variants
+MODEL_URLS = {
+    'movenet_lightning': "https://tfhub.dev/google/movenet/singlepose/lightning/4",
+    'movenet_thunder': "https://tfhub.dev/google/movenet/singlepose/thunder/4",
+}
 
 # Load the MoveNet model
 def load_model(model_name="movenet_lightning"):
@@ -22,12 +37,9 @@ def load_model(model_name="movenet_lightning"):
         model: The loaded MoveNet model signature.
         input_size (int): The expected input size for the model.
     """
-    if model_name == "movenet_lightning":
-        module = hub.load("https://tfhub.dev/google/movenet/singlepose/lightning/4")
-    elif model_name == "movenet_thunder":
-        module = hub.load("https://tfhub.dev/google/movenet/singlepose/thunder/4")
-    else:
+    if model_name not in MODEL_URLS:
         raise ValueError("Unsupported model name. Choose 'movenet_lightning' or 'movenet_thunder'.")
+    module = hub.load(MODEL_URLS[model_name])
 
     input_size = 192 if model_name == "movenet_lightning" else 256
     model = module.signatures['serving_default']
@@ -187,24 +199,21 @@ def crop_and_resize(image, crop_region, crop_size):
         image, box_indices=[0], boxes=boxes, crop_size=crop_size)
     return output_image
 
+def map_keypoints_to_image(keypoints_with_scores, crop_region):
+    """Maps keypoints from crop coordinates back to normalized image coordinates."""
+    keypoints_with_scores[..., 0] = (
+        crop_region['y_min'] + crop_region['height'] * keypoints_with_scores[..., 0])
+    keypoints_with_scores[..., 1] = (
+        crop_region['x_min'] + crop_region['width'] * keypoints_with_scores[..., 1])
+    return keypoints_with_scores
+
 def run_inference(movenet_model, image, crop_region, crop_size):
     """Runs model inference on the cropped region."""
-    image_height, image_width, _ = image.shape
     input_image = crop_and_resize(
         tf.expand_dims(image, axis=0), crop_region, crop_size=crop_size)
     keypoints_with_scores = movenet_inference(movenet_model, input_image)
     # Update the coordinates.
-    for idx in range(17):
-        keypoints_with_scores[0, 0, idx, 0] = (
-            crop_region['y_min'] * image_height +
-            crop_region['height'] * image_height * 
-            keypoints_with_scores[0, 0, idx, 0]) / image_height
-        keypoints_with_scores[0, 0, idx, 1] = (
-            crop_region['x_min'] * image_width +
-            crop_region['width'] * image_width * 
-            keypoints_with_scores[0, 0, idx, 1]) / image_width
-
-    return keypoints_with_scores
+    return map_keypoints_to_image(keypoints_with_scores, crop_region)
 
 def extract_frames(video_path):
     """Extracts frames from a video file."""
@@ -215,22 +224,42 @@ def extract_frames(video_path):
     reader.close()
     return frames
 
-def extract_keypoints_and_crop(movenet_model, frames, input_size):
-    """Extracts keypoints and adjusts crop regions for each frame."""
+def estimate_decoded_size(video_path):
+    """Estimates the bytes needed to hold every decoded RGB frame of a video."""
+    capture = cv2.VideoCapture(video_path)
+    try:
+        frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        width = int(capture.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    finally:
+        capture.release()
+    return max(frame_count, 0) * width * height * 3
+
+def extract_keypoints_and_crop(movenet_model, frames, input_size, scheduler=None):
+    """
+    Extracts keypoints and adjusts crop regions for each frame.
+
+    When a scheduler is given, inference is submitted to it instead of calling
+    the model directly, so frames from concurrent requests share its batches.
+    """
     num_frames = len(frames)
     image_height, image_width = frames[0].shape[:2]
     crop_region = init_crop_region(image_height, image_width)
     detected_keypoints = []
 
-    for frame_idx in tqdm(range(num_frames), desc="Detecting keypoints"):
-        image = np.array(Image.fromarray(frames[frame_idx]).convert("RGB"))
-        keypoints_with_scores = run_inference(
-            movenet_model, image, crop_region, crop_size=[input_size, input_size]
-        )
-        detected_keypoints.append(keypoints_with_scores)
-        crop_region = determine_crop_region(
-            keypoints_with_scores, image_height, image_width
-        )
+    with scheduler.detecting() if scheduler is not None else nullcontext():
+        for frame_idx in tqdm(range(num_frames), desc="Detecting keypoints"):
+            image = np.array(Image.fromarray(frames[frame_idx]).convert("RGB"))
+            if scheduler is not None:
+                keypoints_with_scores = scheduler.run_inference(image, crop_region)
+            else:
+                keypoints_with_scores = run_inference(
+                    movenet_model, image, crop_region, crop_size=[input_size, input_size]
+                )
+            detected_keypoints.append(keypoints_with_scores)
+            crop_region = determine_crop_region(
+                keypoints_with_scores, image_height, image_width
+            )
 
     return detected_keypoints
 
@@ -293,6 +322,137 @@ def compute_per_frame_keypoint_similarity(ref_kpts, target_kpts):
         per_frame_similarities.append(similarities)
     return np.array(per_frame_similarities)
 
+# Joints whose angle is measured, as (vertex, (end_a, vertex, end_b)).
+# Both segments of every angle are edges in EDGES.
+ANGLE_JOINTS = {
+    'left_elbow': ('left_shoulder', 'left_elbow', 'left_wrist'),
+    'right_elbow': ('right_shoulder', 'right_elbow', 'right_wrist'),
+    'left_shoulder': ('left_elbow', 'left_shoulder', 'left_hip'),
+    'right_shoulder': ('right_elbow', 'right_shoulder', 'right_hip'),
+    'left_hip': ('left_shoulder', 'left_hip', 'left_knee'),
+    'right_hip': ('right_shoulder', 'right_hip', 'right_knee'),
+    'left_knee': ('left_hip', 'left_knee', 'left_ankle'),
+    'right_knee': ('right_hip', 'right_knee', 'right_ankle'),
+}
+_ANGLE_INDICES = np.array(
+    [[KEYPOINT_DICT[joint] for joint in triplet] for triplet in ANGLE_JOINTS.values()])
+
+def compute_joint_angles(keypoints, image_shape):
+    """
+    Computes joint angles and their confidences for a whole keypoint sequence.
+
+    Args:
+        keypoints (np.ndarray): Keypoints with scores, shape (frames, 17, 3).
+        image_shape (tuple): (height, width) of the frames, so angles are measured in pixel space.
+
+    Returns:
+        np.ndarray: Angles in radians, shape (frames, len(ANGLE_JOINTS)).
+        np.ndarray: Confidence of each angle (lowest score of its three joints), same shape.
+    """
+    coords = keypoints[:, :, :2] * np.asarray(image_shape[:2], dtype=np.float64)
+    end_a = coords[:, _ANGLE_INDICES[:, 0]]
+    vertex = coords[:, _ANGLE_INDICES[:, 1]]
+    end_b = coords[:, _ANGLE_INDICES[:, 2]]
+    v1 = end_a - vertex
+    v2 = end_b - vertex
+    cos_angle = np.sum(v1 * v2, axis=-1) / (norm(v1, axis=-1) * norm(v2, axis=-1) + 1e-6)
+    angles = np.arccos(np.clip(cos_angle, -1.0, 1.0))
+    weights = keypoints[:, _ANGLE_INDICES, 2].min(axis=-1)
+    return angles, weights
+
+class CoordinateSimilarityEngine:
+    """Cosine similarity of hip-centred, shoulder-width-normalized keypoint coordinates."""
+
+    name = 'coordinate'
+    # Bump whenever the features change, so cached ones are recomputed
+    version = 1
+
+    def extract_features(self, keypoints, image_shape):
+        """Returns the arrays this engine needs, keyed by name (cacheable as-is)."""
+        return {'keypoints': center_and_normalize_keypoints(keypoints)}
+
+    def dtw_series(self, features):
+        """Returns the per-frame vectors DTW aligns on."""
+        normalized = features['keypoints']
+        return normalized[:, :, :2].reshape(len(normalized), -1)
+
+    def score(self, ref_features, target_features, path):
+        """
+        Scores two sequences along a DTW path.
+
+        Returns:
+            float: The overall similarity.
+            np.ndarray: Per-keypoint similarities for every step of the path, shape (steps, 17).
+        """
+        aligned_ref_kpts, aligned_target_kpts = align_sequences(
+            ref_features['keypoints'], target_features['keypoints'], path)
+        overall_similarity = compute_cosine_similarity(aligned_ref_kpts, aligned_target_kpts)
+        per_frame_keypoint_similarities = compute_per_frame_keypoint_similarity(
+            aligned_ref_kpts, aligned_target_kpts)
+        return float(overall_similarity), per_frame_keypoint_similarities
+
+class JointAngleSimilarityEngine:
+    """Confidence-weighted similarity of elbow, shoulder, hip and knee angles."""
+
+    name = 'joint_angle'
+    # Bump whenever the features change, so cached ones are recomputed
+    version = 1
+
+    def extract_features(self, keypoints, image_shape):
+        """Returns the arrays this engine needs, keyed by name (cacheable as-is)."""
+        angles, weights = compute_joint_angles(keypoints, image_shape)
+        return {'angles': angles, 'weights': weights}
+
+    def dtw_series(self, features):
+        """Returns the per-frame vectors DTW aligns on, scaled to [0, 1]."""
+        angles = features['angles']
+        reliable = features['weights'] >= MIN_CROP_KEYPOINT_SCORE
+        # Unreliable angles take the joint's typical value so they do not pull the alignment
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            typical = np.nanmedian(np.where(reliable, angles, np.nan), axis=0)
+        typical = np.where(np.isnan(typical), np.pi / 2, typical)
+        return np.where(reliable, angles, typical) / np.pi
+
+    def score(self, ref_features, target_features, path):
+        """
+        Scores two sequences along a DTW path.
+
+        Returns:
+            float: The overall similarity.
+            np.ndarray: Per-keypoint similarities for every step of the path, shape (steps, 17).
+        """
+        path = np.asarray(path)
+        ref_idx, target_idx = path[:, 0], path[:, 1]
+        angle_similarity = np.cos(
+            ref_features['angles'][ref_idx] - target_features['angles'][target_idx])
+        weights = ref_features['weights'][ref_idx] * target_features['weights'][target_idx]
+
+        total_weight = weights.sum()
+        if total_weight > 0:
+            overall_similarity = np.sum(weights * angle_similarity) / total_weight
+        else:
+            overall_similarity = np.mean(angle_similarity)
+
+        # Joints without an angle, or with an unreliable one, are never flagged
+        per_frame_keypoint_similarities = np.ones((len(path), len(KEYPOINT_DICT)))
+        reliable = np.minimum(ref_features['weights'][ref_idx],
+                              target_features['weights'][target_idx]) >= MIN_CROP_KEYPOINT_SCORE
+        per_frame_keypoint_similarities[:, _ANGLE_INDICES[:, 1]] = np.where(
+            reliable, angle_similarity, 1.0)
+        return float(overall_similarity), per_frame_keypoint_similarities
+
+# Available similarity engines, selectable by name
+SIMILARITY_ENGINES = {
+    engine.name: engine for engine in (CoordinateSimilarityEngine(), JointAngleSimilarityEngine())
+}
+
+def get_similarity_engine(name):
+    """Returns the similarity engine registered under `name`."""
+    if name not in SIMILARITY_ENGINES:
+        raise ValueError(f"Unsupported similarity engine. Choose one of: {', '.join(sorted(SIMILARITY_ENGINES))}.")
+    return SIMILARITY_ENGINES[name]
+
 def draw_prediction_on_image(image, keypoints_with_scores, keypoints_to_mark=None):
     """
     Draws the keypoint predictions on the image using OpenCV.
@@ -358,56 +518,19 @@ def draw_prediction_on_image(image, keypoints_with_scores, keypoints_to_mark=Non
 
     return image
 
-def process_video(input_video_path, reference_video_path, output_video_path, movenet_model, input_size):
+def render_frames(frames_input, detected_keypoints_input, warped_path, per_frame_keypoint_similarities):
     """
-    Processes the input video by comparing it with the reference video.
+    Draws the keypoint overlay for every aligned frame.
 
     Args:
-        input_video_path (str): Path to the input video.
-        reference_video_path (str): Path to the reference video.
-        output_video_path (str): Path to save the processed video.
-        movenet_model: The loaded MoveNet model signature.
-        input_size (int): The input size for the model.
+        frames_input (list): Decoded frames of the input video (RGB/RGBA).
+        detected_keypoints_input (list): Keypoints with scores for each input frame.
+        warped_path (list): DTW warping path as (reference_idx, target_idx) pairs.
+        per_frame_keypoint_similarities (np.ndarray): Per-keypoint similarities along the path.
 
-    Returns:
-        float: The overall similarity score between the input and reference videos.
+    Yields:
+        np.ndarray: The BGR frame with keypoints drawn on it.
     """
-    # Extract frames from both videos
-    frames_input = extract_frames(input_video_path)
-    frames_ref = extract_frames(reference_video_path)
-
-    # Extract keypoints
-    detected_keypoints_input = extract_keypoints_and_crop(movenet_model, frames_input, input_size)
-    detected_keypoints_ref = extract_keypoints_and_crop(movenet_model, frames_ref, input_size)
-
-    # Prepare keypoint arrays
-    reference_kpts = np.array(detected_keypoints_ref).squeeze()
-    target_kpts = np.array(detected_keypoints_input).squeeze()
-
-    # Center and normalize keypoints
-    reference_kpts_norm = center_and_normalize_keypoints(reference_kpts)
-    target_kpts_norm = center_and_normalize_keypoints(target_kpts)
-
-    # Compute the DTW warping path
-    s_ref = reference_kpts_norm[:, :, :2].reshape(len(reference_kpts_norm), -1)
-    s_target = target_kpts_norm[:, :, :2].reshape(len(target_kpts_norm), -1)
-    warped_path = dtw_ndim.warping_path(s_ref, s_target)
-
-    # Align keypoints using the warping paths
-    aligned_ref_kpts, aligned_target_kpts = align_sequences(
-        reference_kpts_norm, target_kpts_norm, warped_path)
-
-    # Compute similarity scores
-    overall_similarity = compute_cosine_similarity(aligned_ref_kpts, aligned_target_kpts)
-    per_frame_keypoint_similarities = compute_per_frame_keypoint_similarity(aligned_ref_kpts, aligned_target_kpts)
-
-    # Initialize VideoWriter
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    fps = 30  # You can set this to the desired FPS
-    frame_height, frame_width = frames_input[0].shape[:2]
-    out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
-
-    # Overlay keypoints on frames
     for idx, (frame_idx_ref, frame_idx_target) in enumerate(tqdm(warped_path, desc="Processing video")):
         frame = frames_input[frame_idx_target].copy()
         keypoints = detected_keypoints_input[frame_idx_target]
@@ -422,10 +545,145 @@ def process_video(input_video_path, reference_video_path, output_video_path, mov
         else:
             frame_bgr = frame.copy()
 
-        frame_with_kpts = draw_prediction_on_image(frame_bgr, keypoints, keypoints_to_mark=keypoints_to_mark)
+        yield draw_prediction_on_image(frame_bgr, keypoints, keypoints_to_mark=keypoints_to_mark)
+
+def write_processed_video(frames_input, detected_keypoints_input, warped_path,
+                          per_frame_keypoint_similarities, output_video_path):
+    """
+    Renders the keypoint overlay for every aligned frame and encodes the output video.
+
+    The video is encoded once, as H.264/yuv420p with the moov atom first, so it
+    plays in HTML5 video and can start while it is still downloading. Only when
+    ffmpeg is unavailable does it fall back to OpenCV's MPEG-4 Part 2 (`mp4v`)
+    writer, which most browsers cannot play.
+
+    Args:
+        frames_input (list): Decoded frames of the input video (RGB/RGBA).
+        detected_keypoints_input (list): Keypoints with scores for each input frame.
+        warped_path (list): DTW warping path as (reference_idx, target_idx) pairs.
+        per_frame_keypoint_similarities (np.ndarray): Per-keypoint similarities along the path.
+        output_video_path (str): Path to save the processed video.
+
+    Raises:
+        OSError: If ffmpeg fails while encoding.
+    """
+    fps = 30  # You can set this to the desired FPS
+    frame_height, frame_width = frames_input[0].shape[:2]
+    rendered = render_frames(frames_input, detected_keypoints_input, warped_path,
+                             per_frame_keypoint_similarities)
+
+    try:
+        import imageio_ffmpeg
+        writer = imageio_ffmpeg.write_frames(
+            output_video_path, (frame_width, frame_height), fps=fps, codec='libx264',
+            pix_fmt_out='yuv420p', macro_block_size=2, ffmpeg_log_level='error',
+            ffmpeg_timeout=FFMPEG_TIMEOUT,
+            output_params=['-preset', 'veryfast', '-movflags', '+faststart'])
+        writer.send(None)  # Starts ffmpeg
+    except (ImportError, RuntimeError, OSError) as e:
+        logger.warning("ffmpeg is unavailable (%s), writing %s as mp4v", e, output_video_path)
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        out = cv2.VideoWriter(output_video_path, fourcc, fps, (frame_width, frame_height))
+        for frame_with_kpts in rendered:
+            out.write(frame_with_kpts)
+        out.release()
+        return
+
+    try:
+        for frame_with_kpts in rendered:
+            writer.send(cv2.cvtColor(frame_with_kpts, cv2.COLOR_BGR2RGB))
+        # Waits at most FFMPEG_TIMEOUT seconds for ffmpeg to finish, then kills it
+        writer.close()
+    except (OSError, RuntimeError) as e:
+        # ffmpeg writes its own error output to the server's stderr
+        logger.warning("ffmpeg failed to encode %s: %s", output_video_path, e)
+        raise
+    finally:
+        writer.close()
+
+def load_sequence_features(video_path, movenet_model, input_size, engine, cache=None, scheduler=None):
+    """
+    Returns keypoints and engine features for a video, using the cache when possible.
+
+    Cached videos are not decoded at all. Features are stored under the
+    engine's name and version; missing or outdated ones are computed from the
+    cached keypoints and replace any older version in the entry.
+
+    Args:
+        video_path (str): Path to the video.
+        movenet_model: The loaded MoveNet model signature.
+        input_size (int): The input size for the model.
+        engine: The similarity engine whose features are needed.
+        cache (KeypointCache, optional): Cache of keypoints and features.
+        scheduler (InferenceScheduler, optional): Shared scheduler to run inference through.
+
+    Returns:
+        np.ndarray: Keypoints with scores, shape (frames, 17, 3).
+        dict: The engine's features.
+    """
+    entry = cache.load(video_path, input_size) if cache is not None else None
+    if entry is None:
+        frames = extract_frames(video_path)
+        detected_keypoints = extract_keypoints_and_crop(
+            movenet_model, frames, input_size, scheduler=scheduler)
+        entry = {
+            'keypoints': np.array(detected_keypoints).squeeze(),
+            'image_shape': np.array(frames[0].shape[:2]),
+        }
+        del frames
+
+    prefix = f"{engine.name}_v{engine.version}__"
+    features = {name[len(prefix):]: array for name, array in entry.items() if name.startswith(prefix)}
+    if not features:
+        features = engine.extract_features(entry['keypoints'], entry['image_shape'])
+        entry = {name: array for name, array in entry.items() if not name.startswith(f"{engine.name}_v")}
+        entry.update({prefix + name: array for name, array in features.items()})
+        if cache is not None:
+            cache.save(video_path, input_size, entry)
+
+    return entry['keypoints'], features
+
+def process_video(input_video_path, reference_video_path, output_video_path, movenet_model, input_size,
+                  scheduler=None, similarity_engine='coordinate', cache=None):
+    """
+    Processes the input video by comparing it with the reference video.
+
+    Args:
+        input_video_path (str): Path to the input video.
+        reference_video_path (str): Path to the reference video.
+        output_video_path (str): Path to save the processed video.
+        movenet_model: The loaded MoveNet model signature.
+        input_size (int): The input size for the model.
+        scheduler (InferenceScheduler, optional): Shared scheduler to run inference through.
+        similarity_engine (str): Name of the engine in SIMILARITY_ENGINES used for DTW and scoring.
+        cache (KeypointCache, optional): Cache for the reference video's keypoints and features.
+
+    Returns:
+        float: The overall similarity score between the input and reference videos.
+    """
+    engine = get_similarity_engine(similarity_engine)
+
+    # Extract frames and keypoints from the input video
+    frames_input = extract_frames(input_video_path)
+    detected_keypoints_input = extract_keypoints_and_crop(
+        movenet_model, frames_input, input_size, scheduler=scheduler)
+    target_kpts = np.array(detected_keypoints_input).squeeze()
+    target_features = engine.extract_features(target_kpts, frames_input[0].shape[:2])
+
+    # The reference video is the same for every request, so its keypoints are cached
+    _, reference_features = load_sequence_features(
+        reference_video_path, movenet_model, input_size, engine, cache=cache, scheduler=scheduler)
+
+    # Compute the DTW warping path
+    warped_path = dtw_ndim.warping_path(
+        engine.dtw_series(reference_features), engine.dtw_series(target_features))
 
-        out.write(frame_with_kpts)
+    # Compute similarity scores along the warping path
+    overall_similarity, per_frame_keypoint_similarities = engine.score(
+        reference_features, target_features, warped_path)
 
-    out.release()
+    write_processed_video(
+        frames_input, detected_keypoints_input, warped_path,
+        per_frame_keypoint_similarities, output_video_path)
 
     return float(overall_similarity)
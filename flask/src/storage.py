@@ -0,0 +1,95 @@
+# storage.py
+
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Only one sweep runs at a time; concurrent callers skip instead of queueing
+_sweep_lock = threading.Lock()
+
+def enforce_retention(folder, max_age_seconds=None, max_total_bytes=None, min_age_seconds=0):
+    """
+    Evicts files from a folder so its disk usage stays bounded.
+
+    Files older than `max_age_seconds` are removed first. If the folder is still
+    larger than `max_total_bytes`, the least recently modified files are removed
+    until it fits. Files modified within the last `min_age_seconds` are never
+    removed, so uploads and outputs of jobs still in progress are kept.
+
+    Cleanup never raises: files or folders that cannot be read or removed are
+    logged and skipped.
+
+    Args:
+        folder (str): Directory to clean up.
+        max_age_seconds (float, optional): Maximum age of a file before it is evicted.
+        max_total_bytes (int, optional): Maximum total size of the folder.
+        min_age_seconds (float): Grace period protecting recently written files.
+
+    Returns:
+        list: Paths of the evicted files.
+    """
+    now = time.time()
+    entries = []
+    try:
+        with os.scandir(folder) as scan:
+            for entry in scan:
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+    except OSError as e:
+        logger.warning("Could not scan %s for retention: %s", folder, e)
+        return []
+    entries.sort()
+
+    evicted = []
+    total_bytes = sum(size for _, size, _ in entries)
+    for mtime, size, path in entries:
+        age = now - mtime
+        if age < min_age_seconds:
+            break
+        expired = max_age_seconds is not None and age > max_age_seconds
+        over_budget = max_total_bytes is not None and total_bytes > max_total_bytes
+        if not (expired or over_budget):
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not evict %s: %s", path, e)
+            continue
+        total_bytes -= size
+        evicted.append(path)
+    return evicted
+
+def sweep(folders, max_age_seconds=None, max_total_bytes=None, min_age_seconds=0):
+    """
+    Applies `enforce_retention` to several folders unless another sweep is running.
+
+    Args:
+        folders (list): Directories to clean up.
+        max_age_seconds (float, optional): Maximum age of a file before it is evicted.
+        max_total_bytes (int, optional): Maximum total size of each folder.
+        min_age_seconds (float): Grace period protecting recently written files.
+
+    Returns:
+        list: Paths of the evicted files.
+    """
+    if not _sweep_lock.acquire(blocking=False):
+        return []
+    try:
+        evicted = []
+        for folder in folders:
+            evicted.extend(enforce_retention(
+                folder, max_age_seconds=max_age_seconds, max_total_bytes=max_total_bytes,
+                min_age_seconds=min_age_seconds))
+        return evicted
+    finally:
+        _sweep_lock.release()
@@ -0,0 +1,123 @@
+import copy
+
+import numpy as np
+import pytest
+
+from src import motion_detector as md
+from src.benchmark import compare_engines, compare_to_baseline
+
+
+def make_results(fps=100.0, peak_rss_mb=1000.0, score=0.9, engine='coordinate'):
+    return {
+        'meta': {'model': 'movenet_lightning', 'device': 'cpu', 'similarity_engine': engine},
+        'clips': {
+            'pushup': {
+                'frames': 100,
+                'score': score,
+                'peak_rss_mb': peak_rss_mb,
+                'stages': {
+                    'decode': {'wall_s': 1.0, 'fps': fps},
+                    'inference': {'wall_s': 2.0, 'fps': fps / 2},
+                },
+            },
+        },
+    }
+
+
+def test_identical_results_pass():
+    baseline = make_results()
+    assert compare_to_baseline(copy.deepcopy(baseline), baseline) == []
+
+
+@pytest.mark.parametrize('fps, regressed', [(85.0, False), (79.0, True)])
+def test_fps_drop_past_threshold(fps, regressed):
+    regressions = compare_to_baseline(make_results(fps=fps), make_results(), max_throughput_drop=0.2)
+    assert bool(regressions) == regressed
+    if regressed:
+        assert any('pushup/decode' in regression for regression in regressions)
+
+
+def test_fps_improvement_passes():
+    assert compare_to_baseline(make_results(fps=500.0), make_results()) == []
+
+
+@pytest.mark.parametrize('peak_rss_mb, regressed', [(1150.0, False), (1250.0, True)])
+def test_peak_rss_growth(peak_rss_mb, regressed):
+    regressions = compare_to_baseline(
+        make_results(peak_rss_mb=peak_rss_mb), make_results(), max_memory_growth=0.2)
+    assert bool(regressions) == regressed
+    if regressed:
+        assert 'peak RSS' in regressions[0]
+
+
+def test_baseline_without_peak_rss_skips_memory_gate():
+    baseline = make_results()
+    del baseline['clips']['pushup']['peak_rss_mb']
+    assert compare_to_baseline(make_results(peak_rss_mb=5000.0), baseline) == []
+
+
+@pytest.mark.parametrize('score, regressed', [(0.905, False), (0.93, True), (0.87, True)])
+def test_score_drift(score, regressed):
+    regressions = compare_to_baseline(make_results(score=score), make_results(), score_tolerance=0.01)
+    assert bool(regressions) == regressed
+
+
+def test_missing_clip_is_a_regression():
+    results = make_results()
+    del results['clips']['pushup']
+    assert compare_to_baseline(results, make_results()) == ['pushup: missing from results']
+
+
+def test_missing_stage_is_a_regression():
+    results = make_results()
+    del results['clips']['pushup']['stages']['inference']
+    assert compare_to_baseline(results, make_results()) == ['pushup/inference: missing from results']
+
+
+def test_engine_mismatch_is_a_regression():
+    regressions = compare_to_baseline(make_results(engine='joint_angle'), make_results())
+    assert any('similarity engine' in regression for regression in regressions)
+
+
+def test_device_mismatch_is_a_regression():
+    results = make_results()
+    results['meta']['device'] = 'gpu'
+    assert any('device' in regression for regression in compare_to_baseline(results, make_results()))
+
+
+def test_fps_none_is_not_compared():
+    results = make_results()
+    results['clips']['pushup']['stages']['decode']['fps'] = None
+    baseline = make_results()
+    baseline['clips']['pushup']['stages']['inference']['fps'] = None
+    assert compare_to_baseline(results, baseline) == []
+
+
+class RenamedJointAngleEngine(md.JointAngleSimilarityEngine):
+    name = 'joint_angle_copy'
+
+
+def test_compare_engines_reports_every_engine_against_coordinate(monkeypatch):
+    monkeypatch.setitem(md.SIMILARITY_ENGINES, RenamedJointAngleEngine.name, RenamedJointAngleEngine())
+    rng = np.random.default_rng(0)
+    clip_keypoints = {f"clip{i}": (rng.uniform(0.2, 0.8, size=(8, 17, 3)), (100, 200)) for i in range(4)}
+
+    report = compare_engines(clip_keypoints)
+
+    assert len(report['pairs']) == 6
+    compared = {'joint_angle', 'joint_angle_copy'}
+    assert all(set(pair['mark_agreement']) == compared for pair in report['pairs'])
+    assert set(report['agreement']) == compared
+    assert report['agreement']['joint_angle'] == report['agreement']['joint_angle_copy']
+    assert report['agreement']['joint_angle']['independent_pairs'] == 6
+    assert 'pearson' in report['agreement']['joint_angle']
+
+
+def test_compare_engines_notes_too_few_pairs():
+    rng = np.random.default_rng(0)
+    clip_keypoints = {f"clip{i}": (rng.uniform(0.2, 0.8, size=(8, 17, 3)), (100, 200)) for i in range(2)}
+
+    agreement = compare_engines(clip_keypoints)['agreement']['joint_angle']
+
+    assert agreement['independent_pairs'] == 1
+    assert 'note' in agreement and 'pearson' not in agreement
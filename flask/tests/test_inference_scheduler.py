@@ -0,0 +1,189 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from src.inference_scheduler import InferenceScheduler, SchedulerBusy
+from src.motion_detector import init_crop_region
+
+INPUT_SIZE = 64
+
+
+class StubModel:
+    """Stands in for a MoveNet signature: fixed outputs, optional delay and batch limit."""
+
+    def __init__(self, delay=0.0, supports_batching=False, error=None):
+        self.delay = delay
+        self.supports_batching = supports_batching
+        self.error = error
+        self.batch_sizes = []
+
+    def __call__(self, input_image):
+        batch_size = input_image.shape[0]
+        if batch_size > 1 and not self.supports_batching:
+            raise ValueError("batch size must be 1")
+        if self.error is not None:
+            raise self.error
+        self.batch_sizes.append(batch_size)
+        if self.delay:
+            time.sleep(self.delay)
+        return {'output_0': tf.fill([batch_size, 1, 17, 3], 0.5)}
+
+
+def make_scheduler(model, **kwargs):
+    kwargs.setdefault('max_batch_latency', 0.05)
+    return InferenceScheduler(model, INPUT_SIZE, **kwargs)
+
+
+def run_frames(scheduler, num_frames):
+    image = np.zeros((48, 64, 3), dtype=np.uint8)
+    crop_region = init_crop_region(48, 64)
+    with scheduler.detecting():
+        return [scheduler.run_inference(image, crop_region) for _ in range(num_frames)]
+
+
+@pytest.mark.parametrize('supports_batching', [False, True])
+def test_single_job_does_not_wait_for_batch(supports_batching):
+    model = StubModel(delay=0.002, supports_batching=supports_batching)
+    scheduler = make_scheduler(model)
+    num_frames = 40
+
+    start = time.perf_counter()
+    with scheduler.job():
+        run_frames(scheduler, num_frames)
+    elapsed = time.perf_counter() - start
+    scheduler.close()
+
+    # Waiting out the 50 ms batch deadline on every frame would take over 2 s
+    assert elapsed < num_frames * scheduler.max_batch_latency / 4
+    assert model.batch_sizes[-num_frames:] == [1] * num_frames
+
+
+def test_idle_job_does_not_hold_batches_open():
+    model = StubModel(delay=0.002, supports_batching=True)
+    scheduler = make_scheduler(model, max_concurrent_jobs=2)
+    num_frames = 40
+    idle_admitted = threading.Event()
+    release_idle = threading.Event()
+
+    def idle_job():
+        # Admitted, but decoding/rendering rather than submitting frames
+        with scheduler.job():
+            idle_admitted.set()
+            release_idle.wait()
+
+    idle = threading.Thread(target=idle_job)
+    idle.start()
+    idle_admitted.wait()
+
+    start = time.perf_counter()
+    with scheduler.job():
+        run_frames(scheduler, num_frames)
+    elapsed = time.perf_counter() - start
+    release_idle.set()
+    idle.join()
+    scheduler.close()
+
+    # Waiting out the 50 ms batch deadline on every frame would take over 2 s
+    assert elapsed < num_frames * scheduler.max_batch_latency / 4
+
+
+def test_detecting_count_is_released_on_error():
+    scheduler = make_scheduler(StubModel(error=RuntimeError("model failed")))
+    with pytest.raises(RuntimeError):
+        run_frames(scheduler, 1)
+    assert scheduler._detecting_jobs == 0
+    scheduler.close()
+
+
+def test_keypoints_are_mapped_to_image_coordinates():
+    scheduler = make_scheduler(StubModel())
+    keypoints = run_frames(scheduler, 1)[0]
+    scheduler.close()
+
+    crop_region = init_crop_region(48, 64)
+    assert keypoints.shape == (1, 1, 17, 3)
+    np.testing.assert_allclose(
+        keypoints[0, 0, :, 0], crop_region['y_min'] + crop_region['height'] * 0.5, rtol=1e-6)
+    np.testing.assert_allclose(
+        keypoints[0, 0, :, 1], crop_region['x_min'] + crop_region['width'] * 0.5, rtol=1e-6)
+
+
+def test_concurrent_jobs_share_batches_when_supported():
+    model = StubModel(delay=0.002, supports_batching=True)
+    scheduler = make_scheduler(model, max_concurrent_jobs=2)
+    barrier = threading.Barrier(2)
+
+    def job():
+        with scheduler.job():
+            barrier.wait()
+            run_frames(scheduler, 20)
+
+    threads = [threading.Thread(target=job) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    scheduler.close()
+
+    # The first call is the scheduler's batching probe
+    frame_batches = model.batch_sizes[1:]
+    assert sum(frame_batches) == 40
+    assert max(frame_batches) == 2
+
+
+def test_model_errors_reach_the_waiting_request():
+    model = StubModel(error=RuntimeError("model failed"))
+    scheduler = make_scheduler(model)
+
+    with pytest.raises(RuntimeError, match="model failed"):
+        run_frames(scheduler, 1)
+
+    # The worker survives the failure and keeps serving
+    model.error = None
+    assert len(run_frames(scheduler, 2)) == 2
+    scheduler.close()
+
+
+def test_job_concurrency_limit_times_out_and_releases():
+    scheduler = make_scheduler(StubModel(), max_concurrent_jobs=1)
+
+    with scheduler.job():
+        with pytest.raises(SchedulerBusy):
+            with scheduler.job(timeout=0.05):
+                pass
+
+    with scheduler.job(timeout=0.05):
+        pass
+    scheduler.close()
+
+
+def test_job_memory_budget_times_out_and_releases():
+    scheduler = make_scheduler(StubModel(), max_concurrent_jobs=3, memory_budget_bytes=100)
+
+    with scheduler.job(nbytes=60):
+        with pytest.raises(SchedulerBusy):
+            with scheduler.job(nbytes=60, timeout=0.05):
+                pass
+        with scheduler.job(nbytes=40, timeout=0.05):
+            assert scheduler._memory_in_use == 100
+
+    assert scheduler._memory_in_use == 0
+    # A job larger than the whole budget runs once it has the budget to itself
+    with scheduler.job(nbytes=500, timeout=0.05):
+        pass
+    scheduler.close()
+
+
+def test_job_released_when_body_raises():
+    scheduler = make_scheduler(StubModel(), max_concurrent_jobs=1, memory_budget_bytes=100)
+
+    with pytest.raises(ValueError):
+        with scheduler.job(nbytes=100):
+            raise ValueError("processing failed")
+
+    with scheduler.job(nbytes=100, timeout=0.05):
+        pass
+    scheduler.close()
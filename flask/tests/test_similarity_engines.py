@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from src import motion_detector as md
+from src.keypoint_cache import KeypointCache
+
+joint_angle_engine = md.SIMILARITY_ENGINES['joint_angle']
+vertex_indices = {md.KEYPOINT_DICT[joints[1]] for joints in md.ANGLE_JOINTS.values()}
+
+
+def make_keypoints(num_frames=5, score=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    keypoints = np.empty((num_frames, 17, 3))
+    keypoints[:, :, :2] = rng.uniform(0.1, 0.9, size=(num_frames, 17, 2))
+    keypoints[:, :, 2] = score
+    return keypoints
+
+
+def diagonal_path(num_frames):
+    return [(i, i) for i in range(num_frames)]
+
+
+def test_angles_are_measured_in_pixels():
+    keypoints = make_keypoints(num_frames=1)
+    # (y, x) pairs that form a right angle only once scaled to a 100x200 (h, w) frame
+    keypoints[0, md.KEYPOINT_DICT['left_shoulder'], :2] = [0.2, 0.4]
+    keypoints[0, md.KEYPOINT_DICT['left_elbow'], :2] = [0.4, 0.5]
+    keypoints[0, md.KEYPOINT_DICT['left_wrist'], :2] = [0.6, 0.4]
+    # Collinear hip, knee and ankle
+    keypoints[0, md.KEYPOINT_DICT['left_hip'], :2] = [0.5, 0.3]
+    keypoints[0, md.KEYPOINT_DICT['left_knee'], :2] = [0.7, 0.4]
+    keypoints[0, md.KEYPOINT_DICT['left_ankle'], :2] = [0.9, 0.5]
+
+    angles, weights = md.compute_joint_angles(keypoints, (100, 200, 3))
+
+    names = list(md.ANGLE_JOINTS)
+    assert angles[0, names.index('left_elbow')] == pytest.approx(np.pi / 2, abs=1e-4)
+    assert angles[0, names.index('left_knee')] == pytest.approx(np.pi, abs=1e-4)
+    assert np.all(weights == 1.0)
+
+
+def test_self_similarity_is_one():
+    features = joint_angle_engine.extract_features(make_keypoints(), (100, 200))
+
+    overall, per_frame = joint_angle_engine.score(features, features, diagonal_path(5))
+
+    assert overall == pytest.approx(1.0)
+    assert per_frame.shape == (5, 17)
+    assert np.allclose(per_frame, 1.0)
+
+
+def test_zero_confidence_is_not_nan_and_not_flagged():
+    ref = joint_angle_engine.extract_features(make_keypoints(score=0.0, seed=0), (100, 200))
+    target = joint_angle_engine.extract_features(make_keypoints(score=0.0, seed=1), (100, 200))
+
+    series = joint_angle_engine.dtw_series(ref)
+    overall, per_frame = joint_angle_engine.score(ref, target, diagonal_path(5))
+
+    assert not np.isnan(series).any()
+    assert not np.isnan(overall)
+    assert np.all(per_frame == 1.0)
+
+
+def test_only_vertex_joints_are_flagged():
+    ref_keypoints = make_keypoints()
+    target_keypoints = ref_keypoints.copy()
+    # Moving the wrists only changes the elbow angles: bent at 90 degrees in the
+    # reference, straight in the target
+    for shoulder, elbow, wrist in (('left_shoulder', 'left_elbow', 'left_wrist'),
+                                   ('right_shoulder', 'right_elbow', 'right_wrist')):
+        upper_arm = ref_keypoints[:, md.KEYPOINT_DICT[elbow], :2] - ref_keypoints[:, md.KEYPOINT_DICT[shoulder], :2]
+        ref_keypoints[:, md.KEYPOINT_DICT[wrist], :2] = (
+            ref_keypoints[:, md.KEYPOINT_DICT[elbow], :2] + upper_arm[:, ::-1] * [1, -1])
+        target_keypoints[:, md.KEYPOINT_DICT[wrist], :2] = (
+            ref_keypoints[:, md.KEYPOINT_DICT[elbow], :2] + upper_arm)
+    ref = joint_angle_engine.extract_features(ref_keypoints, (100, 100))
+    target = joint_angle_engine.extract_features(target_keypoints, (100, 100))
+
+    _, per_frame = joint_angle_engine.score(ref, target, diagonal_path(5))
+
+    flagged = set(np.nonzero((per_frame < 0.9).any(axis=0))[0])
+    assert flagged == {md.KEYPOINT_DICT['left_elbow'], md.KEYPOINT_DICT['right_elbow']}
+    assert flagged <= vertex_indices
+
+
+def test_version_bump_replaces_only_that_engines_features(tmp_path, monkeypatch):
+    video_path = tmp_path / 'reference.mp4'
+    video_path.write_bytes(b'video')
+    cache = KeypointCache(str(tmp_path / 'cache'))
+    keypoints = make_keypoints()
+    monkeypatch.setattr(md, 'extract_frames', lambda path: [np.zeros((100, 200, 3), np.uint8)] * 5)
+    monkeypatch.setattr(md, 'extract_keypoints_and_crop',
+                        lambda model, frames, input_size, scheduler=None: [kpts[None, None] for kpts in keypoints])
+
+    for name in ('coordinate', 'joint_angle'):
+        md.load_sequence_features(str(video_path), None, 192, md.SIMILARITY_ENGINES[name], cache=cache)
+    assert {'joint_angle_v1__angles', 'joint_angle_v1__weights'} <= set(cache.load(str(video_path), 192))
+
+    def decode(path):
+        raise AssertionError("cached keypoints should be reused")
+
+    monkeypatch.setattr(md, 'extract_frames', decode)
+    monkeypatch.setattr(joint_angle_engine, 'version', 2)
+    _, features = md.load_sequence_features(str(video_path), None, 192, joint_angle_engine, cache=cache)
+
+    assert set(features) == {'angles', 'weights'}
+    assert set(cache.load(str(video_path), 192)) == {
+        'keypoints', 'image_shape', 'coordinate_v1__keypoints',
+        'joint_angle_v2__angles', 'joint_angle_v2__weights'}
@@ -0,0 +1,44 @@
+import os
+import time
+
+from src.storage import enforce_retention, sweep
+
+
+def make_file(folder, name, size, age):
+    path = os.path.join(folder, name)
+    with open(path, 'wb') as f:
+        f.write(b'\0' * size)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_evicts_expired_then_oldest_until_under_budget(tmp_path):
+    expired = make_file(tmp_path, 'expired.mp4', 10, age=100)
+    old = make_file(tmp_path, 'old.mp4', 10, age=50)
+    newer = make_file(tmp_path, 'newer.mp4', 10, age=40)
+    recent = make_file(tmp_path, 'recent.mp4', 10, age=1)
+
+    evicted = enforce_retention(tmp_path, max_age_seconds=90, max_total_bytes=15, min_age_seconds=10)
+
+    # Eviction stops at the grace period even though the folder is still over budget
+    assert evicted == [expired, old, newer]
+    assert os.listdir(tmp_path) == [os.path.basename(recent)]
+
+
+def test_removal_errors_are_skipped(tmp_path, monkeypatch):
+    locked = make_file(tmp_path, 'locked.mp4', 10, age=100)
+    other = make_file(tmp_path, 'other.mp4', 10, age=90)
+    real_remove = os.remove
+
+    def remove(path):
+        if path == locked:
+            raise PermissionError("locked")
+        real_remove(path)
+
+    monkeypatch.setattr(os, 'remove', remove)
+    assert enforce_retention(tmp_path, max_age_seconds=10) == [other]
+
+
+def test_missing_folder_is_skipped(tmp_path):
+    assert sweep([tmp_path / 'missing'], max_age_seconds=0) == []